@@ -37,31 +37,26 @@ class handler(BaseHTTPRequestHandler):
                 return
             
             # Generate problems
-            problem_gen = ProblemGenerator()
+            problem_gen = ProblemGenerator.get()
             problems = problem_gen.generate_problems(level, topic, num_problems)
             
             # Generate PDF
             worksheet_gen = WorksheetGenerator()
             layout_style = KUMON_LEVELS[level]["layout_style"]
             
-            # Use /tmp for Vercel
-            output_dir = '/tmp'
-            os.makedirs(output_dir, exist_ok=True)
-            
-            pdf_path = worksheet_gen.generate_pdf(
+            # Build in memory; the PDF is only returned, never served from disk later
+            pdf_bytes = worksheet_gen.generate_pdf_bytes(
                 problems=problems,
                 level=level,
                 topic=topic,
-                layout_style=layout_style,
-                output_dir=output_dir
+                layout_style=layout_style
             )
             
-            # Read PDF as base64
+            # Encode PDF as base64
             import base64
-            with open(pdf_path, 'rb') as f:
-                pdf_data = base64.b64encode(f.read()).decode('utf-8')
+            pdf_data = base64.b64encode(pdf_bytes).decode('utf-8')
             
-            pdf_filename = os.path.basename(pdf_path)
+            pdf_filename = worksheet_gen.pdf_filename(level)
             
             # Return response
             response = {
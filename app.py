@@ -54,7 +54,7 @@ def generate_worksheet():
     
     try:
         # Generate problems using AI
-        problem_gen = ProblemGenerator()
+        problem_gen = ProblemGenerator.get()
         problems = problem_gen.generate_problems(
             level=level,
             topic=topic,
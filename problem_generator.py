@@ -4,42 +4,331 @@ Generates math problems based on Kumon level and topic
 Supports both OpenAI and OpenRouter.io
 """
 
+import asyncio
+import atexit
+import contextlib
+import functools
+import hashlib
+import itertools
+import json
 import os
-from openai import OpenAI
+import random
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from types import MappingProxyType
+from openai import AsyncOpenAI, OpenAI, Timeout
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Fallback problem pools, formatted once and sampled with random.choices
+_MULT_B_POOL = [f"{a} × {b} =" for a in range(2, 10) for b in range(2, 10)]
+_ADD_POOL = [f"{a} + {b} =" for a in range(1, 16) for b in range(1, 16)]
+_SUB_POOL = [f"{a} - {b} =" for a in range(10, 21) for b in range(1, a)]
+_FRACTION_POOL = [
+    f"{num1}/{den1} + {num2}/{den2} ="
+    for num1 in range(1, 10) for den1 in range(2, 10)
+    for num2 in range(1, 10) for den2 in range(2, 10)
+]
+_EQUATION_POOL = [f"{a}x + {b} = {c}" for a in range(1, 10) for b in range(1, 10) for c in range(5, 21)]
+_GENERIC_POOL = [f"{a} × {b} =" for a in range(2, 11) for b in range(2, 11)]
+
+@functools.lru_cache(maxsize=256)
+def _fallback_pool(level, topic):
+    """Pick the fallback problem pool for a level/topic (memoized)"""
+    topic_lower = topic.lower()
+    
+    if "multiplication" in topic_lower and level == "B":
+        return _MULT_B_POOL
+    elif "addition" in topic_lower or level == "A":
+        return _ADD_POOL
+    elif "subtraction" in topic_lower:
+        return _SUB_POOL
+    elif "fraction" in topic_lower or level in ["E", "F"]:
+        return _FRACTION_POOL
+    elif "equation" in topic_lower or level in ["G", "H", "I", "J", "K"]:
+        return _EQUATION_POOL
+    else:
+        # Generic problem
+        return _GENERIC_POOL
+
+# Output token budget: a conservative per-problem allowance plus headroom, capped
+MAX_TOKENS_CAP = 1500
+TOKENS_PER_PROBLEM = 30
+
+# In-flight generate_problems calls, keyed by (model, level, topic, num_problems)
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+ProviderConfig = namedtuple('ProviderConfig', ['provider', 'api_key', 'base_url', 'default_model', 'headers'])
+
+# Attribution headers OpenRouter uses for app rankings; OpenAI needs none
+_OPENROUTER_HEADERS = MappingProxyType({
+    "HTTP-Referer": os.getenv('OPENROUTER_SITE_URL', 'http://localhost:5000'),
+    "X-Title": os.getenv('OPENROUTER_APP_NAME', 'Kumon Worksheet Generator'),
+})
+_OPENAI_HEADERS = MappingProxyType({})
+
+def _resolve_provider():
+    """Resolve AI provider settings from the environment"""
+    ai_provider = os.getenv('AI_PROVIDER', 'openrouter').lower()
+    
+    # Get API key
+    if ai_provider == 'openrouter':
+        api_key = os.getenv('OPENROUTER_API_KEY') or os.getenv('OPENAI_API_KEY')
+        base_url = 'https://openrouter.ai/api/v1'
+        default_model = 'openai/gpt-4'
+        headers = _OPENROUTER_HEADERS
+    else:
+        api_key = os.getenv('OPENAI_API_KEY')
+        base_url = None  # Use default OpenAI URL
+        default_model = 'gpt-4'
+        headers = _OPENAI_HEADERS
+    
+    return ProviderConfig(ai_provider, api_key, base_url, os.getenv('OPENAI_MODEL') or default_model, headers)
+
+# Environment is read once per process
+_PROVIDER_CONFIG = _resolve_provider()
+
+# Transient 429/5xx errors are retried by the SDK with jittered exponential backoff
+AI_MAX_RETRIES = int(os.getenv('AI_MAX_RETRIES', '4'))
+
+# Cap on simultaneous AI requests per process, to avoid self-inflicted rate limiting
+AI_MAX_CONCURRENT = int(os.getenv('AI_MAX_CONCURRENT', '8'))
+_request_slots = threading.BoundedSemaphore(AI_MAX_CONCURRENT)
+
+# Fail fast on connect; allow 60s per read. Non-streamed calls (variants, JSON mode, async) get
+# the whole reply in one read, so a slow reply can time out, and the SDK retries timeouts
+# (AI_MAX_RETRIES) like other transient errors. Streamed calls only wait 60s between chunks.
+HTTP_TIMEOUT = Timeout(60.0, connect=5.0)
+
+_client = None
+_client_lock = threading.Lock()
+
+# One keep-alive connection pool per client, shared by every generator in the process
+def _get_client():
+    """Return the shared OpenAI client (OpenRouter is OpenAI-compatible)"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OpenAI(
+                api_key=_PROVIDER_CONFIG.api_key,
+                base_url=_PROVIDER_CONFIG.base_url,
+                default_headers=_PROVIDER_CONFIG.headers,
+                timeout=HTTP_TIMEOUT,
+                max_retries=AI_MAX_RETRIES
+            )
+            atexit.register(_client.close)
+    return _client
+
+# Async state per running event loop: a client's connection pool and an asyncio.Semaphore are both
+# tied to the loop that first uses them, so each loop gets its own, kept for the loop's lifetime
+# so sequential calls reuse the client's keep-alive connections
+_AsyncLoopState = namedtuple('_AsyncLoopState', ['client', 'request_slots', 'inflight', 'closer'])
+_async_loops = {}  # loop -> _AsyncLoopState
+
+async def _close_at_loop_shutdown(loop, client):
+    """Async generator that closes a loop's client when the loop shuts down its async generators
+    (asyncio.run and asyncio.Runner do this before closing the loop)"""
+    try:
+        yield
+    finally:
+        with _client_lock:
+            _async_loops.pop(loop, None)
+        await client.close()
+
+async def _async_loop_state():
+    """Return the running loop's async state, creating it on first use"""
+    loop = asyncio.get_running_loop()
+    with _client_lock:
+        state = _async_loops.get(loop)
+        if state is not None:
+            return state
+        # Forget loops closed without shutting down async generators; their sockets close on GC
+        for closed_loop in [l for l in _async_loops if l.is_closed()]:
+            del _async_loops[closed_loop]
+        client = AsyncOpenAI(
+            api_key=_PROVIDER_CONFIG.api_key,
+            base_url=_PROVIDER_CONFIG.base_url,
+            default_headers=_PROVIDER_CONFIG.headers,
+            timeout=HTTP_TIMEOUT,
+            max_retries=AI_MAX_RETRIES
+        )
+        state = _async_loops[loop] = _AsyncLoopState(
+            client, asyncio.Semaphore(AI_MAX_CONCURRENT), {}, _close_at_loop_shutdown(loop, client)
+        )
+    # Starting the generator registers it with the loop for shutdown_asyncgens()
+    await state.closer.__anext__()
+    return state
+
+@contextlib.asynccontextmanager
+async def _async_request():
+    """Hold one of the running loop's request slots and yield its AsyncOpenAI client"""
+    state = await _async_loop_state()
+    async with state.request_slots:
+        yield state.client
+
+# Numbering prefixes such as "1. ", "(1) " or "Problem 1: "
+_PREFIX_RE = re.compile(r'^(\d+[\.\)\:]|\(?\d+\)|Problem\s+\d+\:?\s*)', re.IGNORECASE)
+# First characters _PREFIX_RE can match; other lines skip the regex entirely
+_PREFIX_START = frozenset('0123456789(Pp')
+
+# Lines mentioning any of these words are instructions or placeholders, not problems
+_SKIP_RE = re.compile(r'problem|solve|find|calculate|example|note', re.IGNORECASE)
+
+def _clean_line(line):
+    """Return line as a problem with numbering removed, or None if it is not a problem"""
+    line = line.strip()
+    if not line:
+        return None
+    # Remove common prefixes like "1. ", "(1) ", "Problem 1: ", etc.
+    if line[0] in _PREFIX_START:
+        line = _PREFIX_RE.sub('', line).strip()
+    # Skip fragments and placeholders or explanations
+    if len(line) > 2 and not _SKIP_RE.search(line):
+        return line
+    return None
+
+# Optional on-disk cache of AI results that survives restarts; disabled unless a directory is set
+PROBLEM_CACHE_DIR = os.getenv('PROBLEM_CACHE_DIR')
+PROBLEM_CACHE_TTL = int(os.getenv('PROBLEM_CACHE_TTL', str(7 * 24 * 3600)))
+
+def _cache_path(model, prompt):
+    """Cache file for a model/prompt pair"""
+    digest = hashlib.sha1(f"{model}\n{prompt}".encode('utf-8')).hexdigest()
+    return os.path.join(PROBLEM_CACHE_DIR, f"{digest}.json")
+
+def _cache_get(path):
+    """Return cached problems, or None if missing, older than PROBLEM_CACHE_TTL or malformed"""
+    try:
+        if time.time() - os.path.getmtime(path) > PROBLEM_CACHE_TTL:
+            return None
+        with open(path, 'r') as f:
+            problems = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if isinstance(problems, list) and all(isinstance(p, str) for p in problems):
+        return problems
+    return None
+
+def _cache_set(path, problems):
+    """Write problems to the cache atomically so readers never see partial files"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(PROBLEM_CACHE_DIR, exist_ok=True)
+        with open(tmp_path, 'w') as f:
+            json.dump(problems, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Warning: could not write problem cache: {e}")
+
+SYSTEM_MESSAGE = "You are an expert at creating Kumon-style math problems that follow their structured, incremental approach."
+JSON_SYSTEM_MESSAGE = SYSTEM_MESSAGE + ' Return JSON of the form {"problems": ["...", "..."]} with one problem per array item.'
+
+# Ask for structured JSON output instead of free text (model must support JSON mode)
+AI_JSON_MODE = os.getenv('AI_JSON_MODE') == '1'
+
+PROMPT_REQUIREMENTS = """CRITICAL REQUIREMENTS:
+- Generate ACTUAL math problems, NOT placeholders like "Problem 1" or "Solve this"
+- Each problem must be a complete, solvable mathematical expression
+- Problems should follow Kumon's incremental difficulty approach
+- Format problems exactly as they would appear on a Kumon worksheet
+- Use appropriate notation for the level (e.g., vertical format for Level B multiplication like "  3\\n× 4\\n---")
+- Problems should progress in small, manageable steps
+- Return ONLY the problems, one per line, with NO numbering, NO explanations, NO labels
+- For algebra problems, include the full equation (e.g., "(x - 3) / 2 - (x - 5) / 6 =")
+- For multiplication, show the actual multiplication (e.g., "3 × 4 =")"""
+
+# Worksheets combined into one request by generate_problems_batch, limited by count and by the
+# summed output budget, which must leave room for the prompt in an 8k-context model such as gpt-4
+BATCH_JOBS_PER_REQUEST = 8
+BATCH_MAX_TOKENS = 4000
+
+# Header line separating worksheets in a batched response, e.g. "=== JOB 2 ==="
+_JOB_HEADER_RE = re.compile(r'^\s*=+\s*JOB\s+(\d+)\s*=+\s*$', re.IGNORECASE | re.MULTILINE)
+
+def _max_tokens(num_problems):
+    """Output token budget for num_problems problems"""
+    return min(MAX_TOKENS_CAP, TOKENS_PER_PROBLEM * num_problems + 100)
+
+def _batch_groups(jobs):
+    """Split (level, topic, num_problems) jobs into consecutive groups that fit one batched request"""
+    group, budget = [], 0
+    for job in jobs:
+        tokens = _max_tokens(job[2])
+        if group and (len(group) == BATCH_JOBS_PER_REQUEST or budget + tokens > BATCH_MAX_TOKENS):
+            yield group
+            group, budget = [], 0
+        group.append(job)
+        budget += tokens
+    if group:
+        yield group
+
+@functools.lru_cache(maxsize=256)
+def _build_prompt(level, topic, num_problems):
+    """Build the problem-generation prompt (memoized per level/topic/count)"""
+    return f"""You are generating {num_problems} Kumon-style math problems for Level {level}, topic: {topic}.
+
+{PROMPT_REQUIREMENTS}
+
+Example output format:
+3 × 4 =
+5 × 7 =
+(x - 3) / 2 - (x - 5) / 6 =
+2x + 5 = 11
+
+Generate {num_problems} problems now:"""
+
+@functools.lru_cache(maxsize=256)
+def _build_batch_prompt(jobs):
+    """Build one prompt covering several (level, topic, num_problems) jobs"""
+    job_lines = "\n".join(
+        f"JOB {i}: {num_problems} problems for Level {level}, topic: {topic}"
+        for i, (level, topic, num_problems) in enumerate(jobs, start=1)
+    )
+    return f"""You are generating Kumon-style math problems for {len(jobs)} separate worksheets.
+
+{PROMPT_REQUIREMENTS}
+- Start each worksheet with its header line exactly as shown (e.g., "=== JOB 1 ==="), then its problems
+
+Example output format:
+=== JOB 1 ===
+3 × 4 =
+5 × 7 =
+=== JOB 2 ===
+(x - 3) / 2 - (x - 5) / 6 =
+2x + 5 = 11
+
+Worksheets:
+{job_lines}
+
+Generate all worksheets now:"""
+
 class ProblemGenerator:
     def __init__(self, model=None):
-        # Determine provider
-        ai_provider = os.getenv('AI_PROVIDER', 'openrouter').lower()
-        
-        # Get API key
-        if ai_provider == 'openrouter':
-            api_key = os.getenv('OPENROUTER_API_KEY') or os.getenv('OPENAI_API_KEY')
-            base_url = 'https://openrouter.ai/api/v1'
-            default_model = 'openai/gpt-4'
-        else:
-            api_key = os.getenv('OPENAI_API_KEY')
-            base_url = None  # Use default OpenAI URL
-            default_model = 'gpt-4'
+        config = _PROVIDER_CONFIG
         
-        if not api_key:
+        if not config.api_key:
             raise ValueError(
-                f"{ai_provider.upper()}_API_KEY environment variable is not set. "
+                f"{config.provider.upper()}_API_KEY environment variable is not set. "
                 "Please set OPENAI_API_KEY or OPENROUTER_API_KEY in your .env file"
             )
         
-        # Initialize OpenAI client (OpenRouter is OpenAI-compatible)
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url=base_url
-        )
+        # Reuse the process-wide client and its connection pool
+        self.client = _get_client()
         
         # Set model - use provided, env variable, or default
-        self.model = model or os.getenv('OPENAI_MODEL') or default_model
-        self.provider = ai_provider
+        self.model = model or config.default_model
+        self.provider = config.provider
+    
+    @classmethod
+    @functools.lru_cache(maxsize=4)
+    def get(cls, model=None):
+        """Return a shared generator for model, constructed once per process"""
+        return cls(model)
     
     def generate_problems(self, level, topic, num_problems=10):
         """
@@ -53,109 +342,398 @@ class ProblemGenerator:
         Returns:
             List of problem strings
         """
-        prompt = f"""You are generating {num_problems} Kumon-style math problems for Level {level}, topic: {topic}.
-
-CRITICAL REQUIREMENTS:
-- Generate ACTUAL math problems, NOT placeholders like "Problem 1" or "Solve this"
-- Each problem must be a complete, solvable mathematical expression
-- Problems should follow Kumon's incremental difficulty approach
-- Format problems exactly as they would appear on a Kumon worksheet
-- Use appropriate notation for the level (e.g., vertical format for Level B multiplication like "  3\\n× 4\\n---")
-- Problems should progress in small, manageable steps
-- Return ONLY the problems, one per line, with NO numbering, NO explanations, NO labels
-- For algebra problems, include the full equation (e.g., "(x - 3) / 2 - (x - 5) / 6 =")
-- For multiplication, show the actual multiplication (e.g., "3 × 4 =")
-
-Example output format:
-3 × 4 =
-5 × 7 =
-(x - 3) / 2 - (x - 5) / 6 =
-2x + 5 = 11
-
-Generate {num_problems} problems now:"""
+        # Identical concurrent requests share one AI call instead of each dispatching
+        key = (self.model, level, topic, num_problems)
+        with _inflight_lock:
+            future = _inflight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = _inflight[key] = Future()
+        
+        if not is_leader:
+            return list(future.result())
+        
+        try:
+            problems = self._generate_problems(level, topic, num_problems)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with _inflight_lock:
+                del _inflight[key]
+        future.set_result(problems)
+        return problems
+    
+    async def agenerate_problems_threaded(self, level, topic, num_problems=10):
+        """
+        Async wrapper around generate_problems for async web handlers
+        
+        Runs the blocking AI call in a worker thread so the event loop keeps
+        serving other requests; concurrent calls still share in-flight results.
+        """
+        return await asyncio.to_thread(self.generate_problems, level, topic, num_problems)
+    
+    async def agenerate_problems(self, level, topic, num_problems=10):
+        """
+        Generate math problems using the async client
+        
+        Several worksheets can be requested concurrently, e.g.
+        `await asyncio.gather(pg.agenerate_problems('B', t1), pg.agenerate_problems('H', t2))`,
+        so total latency is that of the slowest call rather than the sum.
+        Honours PROBLEM_CACHE_DIR and AI_JSON_MODE like generate_problems.
+        """
+        # Identical concurrent requests on this loop share one AI call, as in generate_problems
+        inflight = (await _async_loop_state()).inflight
+        key = (self.model, level, topic, num_problems)
+        future = inflight.get(key)
+        if future is not None:
+            return list(await asyncio.shield(future))
+        
+        future = inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            problems = await self._agenerate_problems(level, topic, num_problems)
+        except BaseException:
+            # AI errors already fall back inside _agenerate_problems, so this is cancellation
+            future.cancel()
+            raise
+        finally:
+            del inflight[key]
+        future.set_result(problems)
+        return problems
+    
+    async def _agenerate_problems(self, level, topic, num_problems):
+        """Async counterpart of _generate_problems"""
+        prompt = _build_prompt(level, topic, num_problems)
+        
+        cache_path = _cache_path(self.model, prompt) if PROBLEM_CACHE_DIR else None
+        if cache_path:
+            cached = _cache_get(cache_path)
+            if cached:
+                return self._fill_problems(cached, level, topic, num_problems)
+        
+        try:
+            async with _async_request() as client:
+                if AI_JSON_MODE:
+                    response = await client.chat.completions.create(
+                        **self._json_chat_kwargs(prompt, num_problems)
+                    )
+                    problems = self._parse_json_problems(response.choices[0].message.content, num_problems)
+                else:
+                    response = await client.chat.completions.create(
+                        **self._chat_kwargs(prompt, _max_tokens(num_problems))
+                    )
+                    problems = self._clean_problems(response.choices[0].message.content, num_problems)
+            # Only cache complete sets; a short reply would otherwise be padded for PROBLEM_CACHE_TTL
+            if cache_path and len(problems) >= num_problems:
+                _cache_set(cache_path, problems)
+            return self._fill_problems(problems, level, topic, num_problems)
+        except Exception as e:
+            print(f"Error generating problems with AI: {e}")
+            return self._generate_fallback_problems(level, topic, num_problems)
+    
+    def _generate_problems(self, level, topic, num_problems):
+        """Request problems from the AI, falling back to generated ones on failure"""
+        prompt = _build_prompt(level, topic, num_problems)
+        
+        cache_path = _cache_path(self.model, prompt) if PROBLEM_CACHE_DIR else None
+        if cache_path:
+            cached = _cache_get(cache_path)
+            if cached:
+                return self._fill_problems(cached, level, topic, num_problems)
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert at creating Kumon-style math problems that follow their structured, incremental approach."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=1000
-            )
+            if AI_JSON_MODE:
+                problems = self._json_problems(prompt, num_problems)
+            else:
+                problems = self._stream_problems(prompt, num_problems)
+            # Only cache complete sets; a short reply would otherwise be padded for PROBLEM_CACHE_TTL
+            if cache_path and len(problems) >= num_problems:
+                _cache_set(cache_path, problems)
+            return self._fill_problems(problems, level, topic, num_problems)
             
-            problems_text = response.choices[0].message.content.strip()
+        except Exception as e:
+            # Fallback: Generate simple problems if AI fails
+            print(f"Error generating problems with AI: {e}")
+            return self._generate_fallback_problems(level, topic, num_problems)
+    
+    def generate_problems_batch(self, jobs):
+        """
+        Generate problems for several worksheets with as few API calls as possible
+        
+        Jobs are grouped into requests of up to BATCH_JOBS_PER_REQUEST jobs and
+        BATCH_MAX_TOKENS of output; each response is split on "=== JOB n ==="
+        headers and each block is cleaned separately.
+        
+        Args:
+            jobs: List of (level, topic, num_problems) tuples
             
-            # Clean up the problems - remove numbering, labels, etc.
-            lines = problems_text.split('\n')
-            problems = []
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                # Remove common prefixes like "1. ", "(1) ", "Problem 1: ", etc.
-                import re
-                line = re.sub(r'^(\d+[\.\)\:]|\(?\d+\)|Problem\s+\d+\:?\s*)', '', line, flags=re.IGNORECASE)
-                line = line.strip()
-                # Skip if it's just a placeholder or explanation
-                if line and not any(word in line.lower() for word in ['problem', 'solve', 'find', 'calculate', 'example', 'note']):
-                    problems.append(line)
+        Returns:
+            List of problem lists, in the same order as jobs
+        """
+        results = []
+        for group in _batch_groups(tuple(job) for job in jobs):
+            results.extend(self._generate_batch_chunk(group))
+        return results
+    
+    def _generate_batch_chunk(self, jobs):
+        """Generate one batched request's worth of jobs"""
+        prompt = _build_batch_prompt(tuple(jobs))
+        max_tokens = sum(_max_tokens(num_problems) for _, _, num_problems in jobs)
+        
+        blocks = {}
+        try:
+            parts = _JOB_HEADER_RE.split(self._stream_text(prompt, max_tokens))
+            # parts = [preamble, job_number, block, job_number, block, ...]
+            for number, block in zip(parts[1::2], parts[2::2]):
+                blocks[int(number)] = block
+        except Exception as e:
+            print(f"Error generating batched problems with AI: {e}")
+        
+        return [
+            self._fill_problems(self._clean_problems(blocks.get(i, ''), num_problems), level, topic, num_problems)
+            for i, (level, topic, num_problems) in enumerate(jobs, start=1)
+        ]
+    
+    def submit_batch(self, jobs):
+        """
+        Submit worksheet jobs to the OpenAI Batch API for offline generation
+        
+        Batch requests are billed at a discount and use a separate rate-limit
+        pool, but complete asynchronously (within 24 hours). OpenAI only.
+        
+        Args:
+            jobs: List of (level, topic, num_problems) tuples
+            
+        Returns:
+            Batch ID to pass to collect_batch
+        """
+        if self.provider != 'openai':
+            raise ValueError("The Batch API requires AI_PROVIDER=openai")
+        
+        requests = []
+        for i, (level, topic, num_problems) in enumerate(jobs):
+            prompt = _build_prompt(level, topic, num_problems)
+            requests.append(json.dumps({
+                "custom_id": f"job-{i}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": self._chat_kwargs(prompt, _max_tokens(num_problems))
+            }))
+        
+        batch_file = self.client.files.create(
+            file=("kumon_problems.jsonl", "\n".join(requests).encode('utf-8')),
+            purpose="batch"
+        )
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        return batch.id
+    
+    def collect_batch(self, batch_id, jobs):
+        """
+        Fetch the results of a batch submitted with submit_batch
+        
+        Args:
+            batch_id: ID returned by submit_batch
+            jobs: The same job list that was submitted
             
-            # Filter out invalid problems
-            valid_problems = [p for p in problems if p and len(p) > 2 and not p.startswith('Problem')]
+        Returns:
+            List of problem lists in job order, or None if the batch is still running.
+            Jobs the Batch API could not complete are None (their errors are printed).
             
-            # If we got good problems, use them; otherwise generate fallback
-            if len(valid_problems) >= num_problems:
-                return valid_problems[:num_problems]
-            elif len(valid_problems) > 0:
-                # Fill remaining with variations
-                while len(valid_problems) < num_problems:
-                    valid_problems.extend(valid_problems[:num_problems - len(valid_problems)])
-                return valid_problems[:num_problems]
+        Raises:
+            RuntimeError: If the batch failed, expired or was cancelled
+        """
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status in ('validating', 'in_progress', 'finalizing', 'cancelling'):
+            return None
+        if batch.status != 'completed':
+            errors = getattr(batch.errors, 'data', None) or []
+            detail = "; ".join(e.message for e in errors if getattr(e, 'message', None))
+            raise RuntimeError(f"Batch {batch_id} {batch.status}" + (f": {detail}" if detail else ""))
+        
+        contents = {}
+        errors = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line:
+                    continue
+                result = json.loads(line)
+                response = result.get('response') or {}
+                body = response.get('body') or {}
+                if response.get('status_code') == 200 and body.get('choices'):
+                    contents[result['custom_id']] = body['choices'][0]['message']['content']
+                else:
+                    error = result.get('error') or body.get('error') or {}
+                    errors[result['custom_id']] = error.get('message') or f"HTTP {response.get('status_code')}"
+        
+        results = []
+        for i, (level, topic, num_problems) in enumerate(jobs):
+            custom_id = f"job-{i}"
+            if custom_id in contents:
+                problems = self._clean_problems(contents[custom_id], num_problems)
+                results.append(self._fill_problems(problems, level, topic, num_problems))
             else:
-                # Fall back to generated problems
-                print("Warning: AI didn't generate valid problems, using fallback generator")
-                return self._generate_fallback_problems(level, topic, num_problems)
+                print(f"Error in batch {batch_id} {custom_id}: {errors.get(custom_id, 'no result returned')}")
+                results.append(None)
+        return results
+    
+    def generate_problem_variants(self, level, topic, num_problems=10, n_variants=3):
+        """
+        Generate several independent problem sets in a single API call
+        
+        Uses the `n` completion parameter so the prompt is only sent and
+        processed once; each choice is cleaned like generate_problems output.
+        
+        Args:
+            level: Kumon level (e.g., 'B', 'H')
+            topic: Topic within that level
+            num_problems: Number of problems per variant
+            n_variants: Number of problem sets to generate
             
+        Returns:
+            List of problem lists, one per variant
+        """
+        prompt = _build_prompt(level, topic, num_problems)
+        
+        try:
+            response = self._chat(prompt, _max_tokens(num_problems), n=n_variants)
+            variants = [
+                self._fill_problems(self._clean_problems(choice.message.content, num_problems), level, topic, num_problems)
+                for choice in response.choices
+            ]
         except Exception as e:
-            # Fallback: Generate simple problems if AI fails
-            print(f"Error generating problems with AI: {e}")
+            print(f"Error generating problem variants with AI: {e}")
+            variants = []
+        
+        # Some providers ignore `n` and return a single choice
+        while len(variants) < n_variants:
+            variants.append(self._generate_fallback_problems(level, topic, num_problems))
+        return variants[:n_variants]
+    
+    def _chat(self, prompt, max_tokens, **kwargs):
+        """Send the problem prompt to the chat completions API"""
+        with _request_slots:
+            return self.client.chat.completions.create(**self._chat_kwargs(prompt, max_tokens, **kwargs))
+    
+    def _stream_text(self, prompt, max_tokens):
+        """Stream a completion and return its full text
+        
+        Long replies are streamed so HTTP_TIMEOUT's read limit applies between
+        chunks rather than to the whole reply, which could otherwise time out
+        and be retried (and billed) again.
+        """
+        with _request_slots:
+            stream = self.client.chat.completions.create(
+                **self._chat_kwargs(prompt, max_tokens, stream=True)
+            )
+            try:
+                return ''.join(chunk.choices[0].delta.content or '' for chunk in stream if chunk.choices)
+            finally:
+                stream.close()
+    
+    def _chat_kwargs(self, prompt, max_tokens, system_message=SYSTEM_MESSAGE, **kwargs):
+        """Build chat completion arguments shared by the sync and async clients"""
+        return dict(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            max_tokens=max_tokens,
+            **kwargs
+        )
+    
+    def _clean_problems(self, problems_text, limit=None):
+        """Strip numbering, labels and explanations from raw AI output, stopping after limit problems"""
+        valid_problems = []
+        for line in problems_text.splitlines():
+            problem = _clean_line(line)
+            if problem:
+                valid_problems.append(problem)
+                if len(valid_problems) == limit:
+                    break
+        
+        return valid_problems
+    
+    def _json_problems(self, prompt, num_problems):
+        """Request problems as a JSON object"""
+        with _request_slots:
+            response = self.client.chat.completions.create(**self._json_chat_kwargs(prompt, num_problems))
+        return self._parse_json_problems(response.choices[0].message.content, num_problems)
+    
+    def _json_chat_kwargs(self, prompt, num_problems):
+        """Chat completion arguments for a JSON-mode problem request"""
+        return self._chat_kwargs(
+            prompt,
+            _max_tokens(num_problems),
+            system_message=JSON_SYSTEM_MESSAGE,
+            response_format={"type": "json_object"}
+        )
+    
+    def _parse_json_problems(self, content, num_problems):
+        """Extract problems from a JSON-mode reply; only text that isn't JSON at all is line-cleaned"""
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError:
+            return self._clean_problems(content, num_problems)
+        
+        # Valid JSON of the wrong shape is unusable; an empty result lets _fill_problems fall back
+        problems = data.get('problems') if isinstance(data, dict) else None
+        if not isinstance(problems, list):
+            return []
+        return [p.strip() for p in problems if isinstance(p, str) and p.strip()]
+    
+    def _stream_problems(self, prompt, num_problems):
+        """Stream the completion and clean lines as they arrive, stopping once enough are found"""
+        valid_problems = []
+        buffer = ''
+        # Hold a request slot until the stream is fully consumed or closed
+        with _request_slots:
+            stream = self.client.chat.completions.create(
+                **self._chat_kwargs(prompt, _max_tokens(num_problems), stream=True)
+            )
+            try:
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    buffer += chunk.choices[0].delta.content or ''
+                    if '\n' not in buffer:
+                        continue
+                    *lines, buffer = buffer.split('\n')
+                    for line in lines:
+                        problem = _clean_line(line)
+                        if problem:
+                            valid_problems.append(problem)
+                            if len(valid_problems) == num_problems:
+                                return valid_problems
+                
+                problem = _clean_line(buffer)
+                if problem:
+                    valid_problems.append(problem)
+                return valid_problems
+            finally:
+                # Closing early stops the server generating tokens we no longer need
+                stream.close()
+    
+    def _fill_problems(self, valid_problems, level, topic, num_problems):
+        """Trim or pad cleaned problems to num_problems, falling back if none are usable"""
+        # If we got good problems, use them; otherwise generate fallback
+        if len(valid_problems) >= num_problems:
+            return valid_problems[:num_problems]
+        elif len(valid_problems) > 0:
+            # Fill remaining by repeating the problems we got
+            return list(itertools.islice(itertools.cycle(valid_problems), num_problems))
+        else:
+            # Fall back to generated problems
+            print("Warning: AI didn't generate valid problems, using fallback generator")
             return self._generate_fallback_problems(level, topic, num_problems)
     
     def _generate_fallback_problems(self, level, topic, num_problems):
         """Generate basic problems as fallback"""
-        import random
-        problems = []
-        
-        topic_lower = topic.lower()
-        
-        for i in range(num_problems):
-            if "multiplication" in topic_lower and level == "B":
-                a = random.randint(2, 9)
-                b = random.randint(2, 9)
-                problems.append(f"{a} × {b} =")
-            elif "addition" in topic_lower or level == "A":
-                a = random.randint(1, 15)
-                b = random.randint(1, 15)
-                problems.append(f"{a} + {b} =")
-            elif "subtraction" in topic_lower:
-                a = random.randint(10, 20)
-                b = random.randint(1, a-1)
-                problems.append(f"{a} - {b} =")
-            elif "fraction" in topic_lower or level in ["E", "F"]:
-                num1, den1 = random.randint(1, 9), random.randint(2, 9)
-                num2, den2 = random.randint(1, 9), random.randint(2, 9)
-                problems.append(f"{num1}/{den1} + {num2}/{den2} =")
-            elif "equation" in topic_lower or level in ["G", "H", "I", "J", "K"]:
-                a, b = random.randint(1, 9), random.randint(1, 9)
-                c = random.randint(5, 20)
-                problems.append(f"{a}x + {b} = {c}")
-            else:
-                # Generic problem
-                a = random.randint(2, 10)
-                b = random.randint(2, 10)
-                problems.append(f"{a} × {b} =")
-        
-        return problems
-
+        return random.choices(_fallback_pool(level, topic), k=num_problems)
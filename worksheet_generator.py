@@ -5,111 +5,278 @@ Creates Kumon-style worksheets with proper formatting and layout matching actual
 
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch, cm
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Table, TableStyle, Image as RLImage, BaseDocTemplate, PageTemplate, Frame
-from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, Spacer, PageBreak, Table, TableStyle, BaseDocTemplate, PageTemplate, Frame, Flowable
+from reportlab.lib.enums import TA_LEFT, TA_CENTER
 from reportlab.lib.colors import black, HexColor, white
-from reportlab.pdfgen import canvas
+from reportlab.lib.fonts import tt2ps
 from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+import io
 import os
 import json
-from datetime import datetime
+import time
+from xml.sax.saxutils import escape
+from concurrent.futures import ProcessPoolExecutor
+
+def _preload_fonts(*font_names):
+    """Load built-in font metrics once at import
+    (getFont raises if a name is unknown, so a typo fails here rather than mid-build)"""
+    for font_name in font_names:
+        pdfmetrics.getFont(font_name)
+
+_preload_fonts('Helvetica', 'Helvetica-Bold')
+
+# Default design specs, used when design_spec.json is missing or invalid
+_DEFAULT_DESIGN = {
+    "colors": {
+        "primary": "#000000",
+        "secondary": "#4B2E83",
+        "background": "#FFFFFF",
+        "table_bg": "#E0E0E0",
+        "footer_text": "#808080"
+    }
+}
+
+# Levels G-O use the two-column problem layout
+_ADVANCED_LEVELS = frozenset('GHIJKLMNO')
+
+# Form XObject name for the per-page copyright footer
+_FOOTER_FORM = 'kumon_footer'
+
+# Letter page with 0.75in margins on every side
+_PAGE_MARGIN = 0.75*inch
+_FRAME_WIDTH = letter[0] - 2*_PAGE_MARGIN
+_FRAME_HEIGHT = letter[1] - 2*_PAGE_MARGIN
+
+# Performance table row shading, parsed once
+_PERF_ROW_BACKGROUNDS = [HexColor('#F5F5F5'), white]
+
+# Vertical gaps between header elements and between single-column problems
+_SPACE_SMALL = 0.1*inch
+_SPACE_MEDIUM = 0.15*inch
+_SPACE_BACK_HEADER = 0.2*inch
+_SPACE_LARGE = 0.3*inch
+_PROBLEM_GAP = 0.6*inch
+
+# Two-column problem grid column widths
+_PROBLEMS_COL_WIDTHS = (3.5*inch, 3.5*inch)
+
+# Two-column problem grid style; read-only once built, so shared by every table
+_PROBLEMS_TABLE_STYLE = TableStyle([
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 0),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 10),
+    ('TOPPADDING', (0, 0), (-1, -1), 0.2*inch),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 0.4*inch),
+])
+
+# Fixed header geometry; row height matches a default Table row (12pt leading + 3pt padding each side)
+_HEADER_ROW_HEIGHT = 18
+_STUDENT_FIELDS = (('Time : to :', 0), ('Date', 2*inch), ('Name', 3.5*inch))
+_STUDENT_WIDTH = 5.5*inch
+_PERF_LABELS = (
+    ('100%', '90%', '80%', '70%', '69%~'),
+    ('(mistakes) 0', '—', '1', '—', '2~'),
+)
+_PERF_COL_X = tuple(i*1.5*inch for i in range(6))
+_PERF_ROW_Y = (2*_HEADER_ROW_HEIGHT, _HEADER_ROW_HEIGHT, 0)
+
+class StudentInfoBar(Flowable):
+    """Student name/date/time fields drawn straight onto the canvas"""
+    
+    def __init__(self):
+        Flowable.__init__(self)
+        self.width = _STUDENT_WIDTH
+        self.height = _HEADER_ROW_HEIGHT
+        self.hAlign = 'CENTER'
+    
+    def wrap(self, availWidth, availHeight):
+        return self.width, self.height
+    
+    def draw(self):
+        canv = self.canv
+        canv.setFillColor(black)
+        canv.setFont('Helvetica', 11)
+        for label, x in _STUDENT_FIELDS:
+            canv.drawString(x, 4, label)
+        canv.setStrokeColor(black)
+        canv.setLineWidth(0.5)
+        canv.line(0, 0, self.width, 0)
+
+class PerformanceBar(Flowable):
+    """Performance-tracking grid drawn straight onto the canvas"""
+    
+    def __init__(self, header_color):
+        Flowable.__init__(self)
+        self.header_color = header_color
+        self.width = _PERF_COL_X[-1]
+        self.height = _PERF_ROW_Y[0]
+        self.hAlign = 'CENTER'
+    
+    def wrap(self, availWidth, availHeight):
+        return self.width, self.height
+    
+    def draw(self):
+        canv = self.canv
+        # Header fill first, then the row shading on top (same paint order as the old table style)
+        canv.setFillColor(self.header_color)
+        canv.rect(0, _PERF_ROW_Y[1], self.width, _HEADER_ROW_HEIGHT, stroke=0, fill=1)
+        for y, color in zip(_PERF_ROW_Y[1:], _PERF_ROW_BACKGROUNDS):
+            canv.setFillColor(color)
+            canv.rect(0, y, self.width, _HEADER_ROW_HEIGHT, stroke=0, fill=1)
+        
+        canv.setFillColor(black)
+        for y, font, labels in zip(_PERF_ROW_Y[1:], ('Helvetica-Bold', 'Helvetica'), _PERF_LABELS):
+            canv.setFont(font, 10)
+            for x0, x1, label in zip(_PERF_COL_X, _PERF_COL_X[1:], labels):
+                canv.drawCentredString((x0 + x1) / 2, y + 5, label)
+        
+        canv.setStrokeColor(black)
+        canv.setLineWidth(1)
+        canv.grid(_PERF_COL_X, _PERF_ROW_Y)
+
+class FastProblem(Flowable):
+    """Numbered problem drawn as a single line with drawString, skipping Paragraph markup parsing.
+    Falls back to a wrapped Paragraph when the line is wider than the available space."""
+    
+    def __init__(self, number, text, style):
+        Flowable.__init__(self)
+        self.style = style
+        self.label = f"({number})"
+        self.text = ' '.join(text.split())
+        self._bold_font = tt2ps(style.fontName, 1, 0)
+        self._text_x = (pdfmetrics.stringWidth(self.label, self._bold_font, style.fontSize)
+                        + pdfmetrics.stringWidth(' ', style.fontName, style.fontSize))
+        self.width = self._text_x + pdfmetrics.stringWidth(self.text, style.fontName, style.fontSize)
+        self.height = style.leading
+        self._para = None
+        self._wrapped = False
+    
+    def wrap(self, availWidth, availHeight):
+        self._wrapped = self.width > availWidth
+        if not self._wrapped:
+            return self.width, self.height
+        if self._para is None:
+            self._para = Paragraph(f"<b>{self.label}</b> {escape(self.text)}", self.style)
+        return self._para.wrap(availWidth, availHeight)
+    
+    def draw(self):
+        if self._wrapped:
+            self._para.drawOn(self.canv, 0, 0)
+            return
+        canv = self.canv
+        style = self.style
+        baseline = self.height - style.fontSize
+        canv.setFillColor(style.textColor)
+        canv.setFont(self._bold_font, style.fontSize)
+        canv.drawString(0, baseline, self.label)
+        canv.setFont(style.fontName, style.fontSize)
+        canv.drawString(self._text_x, baseline, self.text)
 
 class WorksheetGenerator:
+    # Design spec and paragraph styles shared by every instance, built on first use
+    _design_cache = None
+    _styles = None
+    
     def __init__(self):
         self.page_width, self.page_height = letter
-        self.load_design_spec()
-        self.setup_styles()
+        self.design = self.load_design_spec()
+        self.styles = self.setup_styles(self.design)
+        
+        colors = self.design.get('colors', {})
+        self._footer_color = HexColor(colors.get('footer_text', '#808080'))
+        self._table_bg_color = HexColor(colors.get('table_bg', '#E0E0E0'))
     
-    def load_design_spec(self):
-        """Load design specifications from JSON file"""
-        try:
-            with open('design_spec.json', 'r') as f:
-                self.design = json.load(f)
-        except:
-            # Default design specs
-            self.design = {
-                "colors": {
-                    "primary": "#000000",
-                    "secondary": "#4B2E83",
-                    "background": "#FFFFFF",
-                    "table_bg": "#E0E0E0",
-                    "footer_text": "#808080"
-                }
-            }
+    @classmethod
+    def load_design_spec(cls):
+        """Load design specifications from JSON file (read once per process)"""
+        if cls._design_cache is None:
+            try:
+                with open('design_spec.json', 'r') as f:
+                    cls._design_cache = json.load(f)
+            except (OSError, ValueError):
+                cls._design_cache = _DEFAULT_DESIGN
+        return cls._design_cache
     
-    def setup_styles(self):
-        """Setup text styles based on Kumon worksheet design"""
-        self.styles = getSampleStyleSheet()
+    @classmethod
+    def setup_styles(cls, design):
+        """Setup text styles based on Kumon worksheet design (built once per process)"""
+        if cls._styles is not None:
+            return cls._styles
+        
+        styles = getSampleStyleSheet()
+        secondary_color = HexColor(design.get('colors', {}).get('secondary', '#4B2E83'))
         
         # Header styles
-        self.styles.add(ParagraphStyle(
+        styles.add(ParagraphStyle(
             name='KumonLogo',
-            parent=self.styles['Normal'],
+            parent=styles['Normal'],
             fontSize=18,
             fontName='Helvetica-Bold',
-            textColor=HexColor(self.design.get('colors', {}).get('secondary', '#4B2E83')),
+            textColor=secondary_color,
             leading=22
         ))
         
-        self.styles.add(ParagraphStyle(
+        styles.add(ParagraphStyle(
             name='LevelIdentifier',
-            parent=self.styles['Normal'],
+            parent=styles['Normal'],
             fontSize=14,
             fontName='Helvetica-Bold',
-            textColor=HexColor(self.design.get('colors', {}).get('secondary', '#4B2E83')),
+            textColor=secondary_color,
             leading=18
         ))
         
-        self.styles.add(ParagraphStyle(
+        styles.add(ParagraphStyle(
             name='WorksheetTitle',
-            parent=self.styles['Normal'],
+            parent=styles['Normal'],
             fontSize=16,
             fontName='Helvetica-Bold',
-            textColor=HexColor(self.design.get('colors', {}).get('secondary', '#4B2E83')),
+            textColor=secondary_color,
             alignment=TA_CENTER,
             leading=20,
             spaceAfter=12
         ))
         
-        self.styles.add(ParagraphStyle(
+        styles.add(ParagraphStyle(
             name='StudentField',
-            parent=self.styles['Normal'],
+            parent=styles['Normal'],
             fontSize=11,
             fontName='Helvetica',
             leading=14
         ))
         
         # Problem styles
-        self.styles.add(ParagraphStyle(
+        styles.add(ParagraphStyle(
             name='Problem',
-            parent=self.styles['Normal'],
+            parent=styles['Normal'],
             fontSize=11,
             fontName='Helvetica',
             alignment=TA_LEFT,
             leading=14
         ))
         
-        self.styles.add(ParagraphStyle(
+        styles.add(ParagraphStyle(
             name='ProblemNumber',
-            parent=self.styles['Normal'],
+            parent=styles['Normal'],
             fontSize=11,
             fontName='Helvetica-Bold',
             alignment=TA_LEFT,
             leading=14
         ))
         
-        self.styles.add(ParagraphStyle(
+        styles.add(ParagraphStyle(
             name='Instruction',
-            parent=self.styles['Normal'],
+            parent=styles['Normal'],
             fontSize=12,
             fontName='Helvetica',
             alignment=TA_LEFT,
             leading=16
         ))
+        
+        cls._styles = styles
+        return styles
     
-    def generate_pdf(self, problems, level, topic, layout_style='medium_spaced', output_dir='output'):
+    def generate_pdf(self, problems, level, topic, layout_style='medium_spaced', output_dir='output', timestamp=None):
         """
         Generate a PDF worksheet with front and back pages matching Kumon style
         
@@ -119,41 +286,100 @@ class WorksheetGenerator:
             topic: Topic name
             layout_style: Layout style from kumon_levels.json
             output_dir: Directory to save PDF
+            timestamp: Pre-formatted timestamp for the file name (defaults to now)
             
         Returns:
             Path to generated PDF file
         """
         os.makedirs(output_dir, exist_ok=True)
+        filepath = os.path.join(output_dir, self.pdf_filename(level, timestamp))
+        self._build(filepath, problems, level, topic)
+        return filepath
+    
+    def generate_pdf_bytes(self, problems, level, topic, layout_style='medium_spaced'):
+        """
+        Generate a worksheet in memory, for callers that serve it rather than keep it
+        
+        Args:
+            problems: List of problem strings
+            level: Kumon level (e.g., 'B', 'H', 'K')
+            topic: Topic name
+            layout_style: Layout style from kumon_levels.json
+            
+        Returns:
+            PDF file contents as bytes
+        """
+        buffer = io.BytesIO()
+        self._build(buffer, problems, level, topic)
+        return buffer.getvalue()
+    
+    @staticmethod
+    def pdf_filename(level, timestamp=None):
+        """Timestamped file name for a worksheet of the given level"""
+        if timestamp is None:
+            timestamp = time.strftime("%Y%m%d_%H%M%S")
+        return f"kumon_level_{level}_{timestamp}.pdf"
+    
+    def generate_combined_pdf(self, jobs, output_path):
+        """
+        Generate several worksheets into one PDF with a single document build
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"kumon_level_{level}_{timestamp}.pdf"
-        filepath = os.path.join(output_dir, filename)
+        Args:
+            jobs: List of dicts with problems, level and topic (other keys are ignored)
+            output_path: Path of the combined PDF
+            
+        Returns:
+            Path to the combined PDF file
+        """
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
         
-        # Determine layout type based on level
-        is_advanced_level = level in ['G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O']
-        use_two_columns = is_advanced_level
+        story = []
+        for job in jobs:
+            if story:
+                story.append(PageBreak())
+            story.extend(self._worksheet_story(job['problems'], job['level'], job['topic']))
         
-        doc = SimpleDocTemplate(
-            filepath,
+        self._doc_template(output_path, "Kumon Worksheets").build(story)
+        return output_path
+    
+    def _build(self, target, problems, level, topic):
+        """Lay out the worksheet and write it to target (a path or binary file object)"""
+        doc = self._doc_template(target, f"Kumon Level {level} - {topic}")
+        doc.build(self._worksheet_story(problems, level, topic))
+    
+    def _doc_template(self, target, title):
+        """Letter document whose single page template draws the footer"""
+        doc = BaseDocTemplate(
+            target,
             pagesize=letter,
-            rightMargin=0.75*inch,
-            leftMargin=0.75*inch,
-            topMargin=0.75*inch,
-            bottomMargin=0.75*inch,
-            title=f"Kumon Level {level} - {topic}"
+            rightMargin=_PAGE_MARGIN,
+            leftMargin=_PAGE_MARGIN,
+            topMargin=_PAGE_MARGIN,
+            bottomMargin=_PAGE_MARGIN,
+            title=title,
+            pageCompression=1
         )
+        # Frames carry layout state while building, so each document gets its own
+        frame = Frame(_PAGE_MARGIN, _PAGE_MARGIN, _FRAME_WIDTH, _FRAME_HEIGHT, id='normal')
+        doc.addPageTemplates([PageTemplate(id='kumon', frames=[frame], onPage=self._add_footer)])
+        return doc
+    
+    def _worksheet_story(self, problems, level, topic):
+        """Flowables for one worksheet's front and back pages"""
+        # Advanced levels lay problems out in two columns
+        use_two_columns = level in _ADVANCED_LEVELS
         
         story = []
         
-        # Split problems for front and back
+        # Front page gets the first half of the problems, back page the rest
         mid_point = len(problems) // 2
-        front_problems = problems[:mid_point]
-        back_problems = problems[mid_point:]
         
         # Front page
         story.extend(self._create_header(level, topic, page_num=1))
         story.extend(self._create_problems_section(
-            front_problems,
+            problems, 0, mid_point,
             use_two_columns=use_two_columns,
             level=level
         ))
@@ -163,28 +389,50 @@ class WorksheetGenerator:
         # Back page (simpler, no full header)
         story.extend(self._create_back_page_header(level))
         story.extend(self._create_problems_section(
-            back_problems,
+            problems, mid_point, len(problems),
             use_two_columns=use_two_columns,
-            level=level,
-            start_number=len(front_problems) + 1
+            level=level
         ))
         
-        # Build PDF with custom footer
-        doc.build(story, onFirstPage=self._add_footer, onLaterPages=self._add_footer)
-        return filepath
+        return story
+    
+    @staticmethod
+    def generate_pdfs_batch(jobs, max_workers=None):
+        """
+        Generate many worksheets in parallel worker processes
+        
+        Args:
+            jobs: List of dicts of generate_pdf keyword arguments
+                (problems, level, topic, and optionally layout_style, output_dir)
+            max_workers: Number of processes (defaults to the CPU count)
+            
+        Returns:
+            List of generated PDF paths, in job order
+        """
+        # One timestamp for the whole batch, numbered per job so names never collide
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        jobs = [{'timestamp': f"{stamp}_{i:04d}", **job} for i, job in enumerate(jobs, 1)]
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                                 initializer=_init_batch_worker) as pool:
+            return list(pool.map(_generate_batch_job, jobs))
     
     def _add_footer(self, canvas, doc):
         """Add footer with copyright notice on each page"""
-        canvas.saveState()
-        canvas.setFont('Helvetica', 6)
-        canvas.setFillColor(HexColor(self.design.get('colors', {}).get('footer_text', '#808080')))
-        
-        # Add copyright notice on left margin (vertical text)
-        canvas.translate(0.3*inch, 4*inch)
-        canvas.rotate(90)
-        canvas.drawString(0, 0, "© 2002 Kumon Institute of Education")
-        
-        canvas.restoreState()
+        # Draw the notice once per document as a form XObject, then just reference it on each page
+        if not canvas.hasForm(_FOOTER_FORM):
+            canvas.beginForm(_FOOTER_FORM)
+            canvas.saveState()
+            canvas.setFont('Helvetica', 6)
+            canvas.setFillColor(self._footer_color)
+            
+            # Add copyright notice on left margin (vertical text)
+            canvas.translate(0.3*inch, 4*inch)
+            canvas.rotate(90)
+            canvas.drawString(0, 0, "© 2002 Kumon Institute of Education")
+            
+            canvas.restoreState()
+            canvas.endForm()
+        canvas.doForm(_FOOTER_FORM)
     
     def _create_header(self, level, topic, page_num=1):
         """Create the header section matching Kumon style"""
@@ -193,54 +441,23 @@ class WorksheetGenerator:
         # KUMON logo and level identifier (top left)
         logo_text = f"<b>KUMON</b>®"
         content.append(Paragraph(logo_text, self.styles['KumonLogo']))
-        content.append(Spacer(1, 0.1*inch))
+        content.append(Spacer(1, _SPACE_SMALL))
         
         # Level identifier (e.g., "K 91 a")
         level_id = f"<b>{level} {page_num} a</b>" if page_num > 0 else f"<b>{level}</b>"
         content.append(Paragraph(level_id, self.styles['LevelIdentifier']))
-        content.append(Spacer(1, 0.15*inch))
+        content.append(Spacer(1, _SPACE_MEDIUM))
         
         # Title (centered)
         title_text = f"<b>{topic}</b>"
         content.append(Paragraph(title_text, self.styles['WorksheetTitle']))
-        content.append(Spacer(1, 0.1*inch))
+        content.append(Spacer(1, _SPACE_SMALL))
         
-        # Student information fields
-        student_table_data = [
-            ['Time : to :', 'Date', 'Name']
-        ]
-        student_table = Table(student_table_data, colWidths=[2*inch, 1.5*inch, 2*inch])
-        student_table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 11),
-            ('LINEBELOW', (0, 0), (-1, -1), 0.5, black),
-            ('VALIGN', (0, 0), (-1, -1), 'BOTTOM'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 0),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-        ]))
-        content.append(student_table)
-        content.append(Spacer(1, 0.15*inch))
-        
-        # Performance tracking table
-        perf_table_data = [
-            ['100%', '90%', '80%', '70%', '69%~'],
-            ['(mistakes) 0', '—', '1', '—', '2~']
-        ]
-        perf_table = Table(perf_table_data, colWidths=[1.5*inch]*5)
-        perf_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), HexColor(self.design.get('colors', {}).get('table_bg', '#E0E0E0'))),
-            ('TEXTCOLOR', (0, 0), (-1, -1), black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('FONTNAME', (0, 1), (-1, 1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, 1), 10),
-            ('GRID', (0, 0), (-1, -1), 1, black),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('ROWBACKGROUNDS', (0, 0), (-1, -1), [HexColor('#F5F5F5'), white]),
-        ]))
-        content.append(perf_table)
-        content.append(Spacer(1, 0.3*inch))
+        # Student information fields and performance tracking grid (fixed geometry, drawn directly)
+        content.append(StudentInfoBar())
+        content.append(Spacer(1, _SPACE_MEDIUM))
+        content.append(PerformanceBar(self._table_bg_color))
+        content.append(Spacer(1, _SPACE_LARGE))
         
         return content
     
@@ -249,67 +466,47 @@ class WorksheetGenerator:
         content = []
         level_id = f"<b>{level}</b>"
         content.append(Paragraph(level_id, self.styles['LevelIdentifier']))
-        content.append(Spacer(1, 0.2*inch))
+        content.append(Spacer(1, _SPACE_BACK_HEADER))
         return content
     
-    def _create_problems_section(self, problems, use_two_columns=False, level='', start_number=1):
-        """Create the problems section"""
+    def _create_problems_section(self, problems, start, end, use_two_columns=False, level=''):
+        """Create the problems section for problems[start:end], numbered from start + 1"""
         content = []
+        problem_style = self.styles['Problem']
         
-        if use_two_columns and len(problems) > 3:
-            # Two column layout for advanced levels
-            mid = (len(problems) + 1) // 2
-            left_problems = problems[:mid]
-            right_problems = problems[mid:]
-            
-            # Create tables for two columns
-            max_problems = max(len(left_problems), len(right_problems))
-            table_data = []
+        if use_two_columns and end - start > 3:
+            # Two column layout for advanced levels: first half left, second half right
+            rows = (end - start + 1) // 2
+            table_data = [
+                [
+                    FastProblem(i + 1, problems[i], problem_style),
+                    FastProblem(i + rows + 1, problems[i + rows], problem_style) if i + rows < end else ""
+                ]
+                for i in range(start, start + rows)
+            ]
             
-            for i in range(max_problems):
-                left_cell = ""
-                right_cell = ""
-                
-                if i < len(left_problems):
-                    left_para = Paragraph(
-                        self._format_problem(left_problems[i], start_number + i),
-                        self.styles['Problem']
-                    )
-                    left_cell = left_para
-                
-                if i < len(right_problems):
-                    right_para = Paragraph(
-                        self._format_problem(right_problems[i], start_number + len(left_problems) + i),
-                        self.styles['Problem']
-                    )
-                    right_cell = right_para
-                
-                table_data.append([left_cell, right_cell])
-            
-            problems_table = Table(table_data, colWidths=[3.5*inch, 3.5*inch])
-            problems_table.setStyle(TableStyle([
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ('LEFTPADDING', (0, 0), (-1, -1), 0),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 10),
-                ('TOPPADDING', (0, 0), (-1, -1), 0.2*inch),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 0.4*inch),
-            ]))
+            problems_table = Table(table_data, colWidths=_PROBLEMS_COL_WIDTHS)
+            problems_table.setStyle(_PROBLEMS_TABLE_STYLE)
             content.append(problems_table)
         else:
-            # Single column layout
-            for i, problem in enumerate(problems):
-                problem_para = Paragraph(
-                    self._format_problem(problem, start_number + i),
-                    self.styles['Problem']
-                )
-                content.append(problem_para)
-                content.append(Spacer(1, 0.6*inch))
+            # Single column layout, one plain drawn line per problem. Each gap needs its own
+            # Spacer: platypus marks a flowable pushed to the next page and refuses to push it twice
+            content.extend(
+                flowable
+                for i in range(start, end)
+                for flowable in (FastProblem(i + 1, problems[i], problem_style), Spacer(1, _PROBLEM_GAP))
+            )
         
         return content
-    
-    def _format_problem(self, problem_text, problem_number):
-        """Format a single problem with Kumon-style numbering"""
-        return f"<b>({problem_number})</b> {problem_text}"
 
+# Per-process generator for generate_pdfs_batch workers
+_batch_worker_generator = None
 
+def _init_batch_worker():
+    """Build the worker's generator up front so design and style caches are warm"""
+    global _batch_worker_generator
+    _batch_worker_generator = WorksheetGenerator()
 
+def _generate_batch_job(job):
+    """Render one generate_pdfs_batch job in a worker process"""
+    return _batch_worker_generator.generate_pdf(**job)